@@ -11,7 +11,7 @@ This will create a hierarchical structure:
   /branch_0/sub_0/ds_0 ... ds_N
   /branch_0/sub_1/...
   ...
-Each dataset is chunked and has attributes. Dataset sizes are chosen to sum (approximately) to the requested total size.
+Each dataset is contiguous (chunked with --benchmark-chunked) and has attributes. Dataset sizes are chosen to sum (approximately) to the requested total size.
 
 Dependencies:
     pip install h5py numpy
@@ -30,6 +30,21 @@ def human(n):
             return f"{n:3.1f}{u}"
         n /= 1024.0
 
+def random_block(rng, shape, dtype, scratch):
+    """
+    Random values of the requested dtype for one write. Floats are generated
+    directly into a view of the reusable scratch byte buffer; Generator.integers
+    has no out= argument, so ints come back as a new array in their native dtype.
+    """
+    if not np.issubdtype(dtype, np.floating):
+        return rng.integers(0, 1000, size=shape, dtype=dtype)
+    nbytes = math.prod(shape) * np.dtype(dtype).itemsize
+    if nbytes > scratch.nbytes:
+        return rng.random(shape, dtype=dtype)
+    out = scratch[:nbytes].view(dtype).reshape(shape)
+    rng.random(out=out, dtype=dtype)
+    return out
+
 def parse_args():
     p = argparse.ArgumentParser(description="Generate large, complex HDF5 file for I/O benchmarking.")
     p.add_argument("--out", "-o", required=True, help="Output HDF5 file")
@@ -41,12 +56,17 @@ def parse_args():
     p.add_argument("--max-ds-mb", type=int, default=64, help="Maximum dataset size in MB")
     p.add_argument("--seed", type=int, default=0, help="Random seed")
     p.add_argument("--chunks-kb", type=int, default=64, help="Target chunk size in KB")
+    p.add_argument("--contiguous", dest="contiguous", action="store_true", default=True,
+                   help="Write-once contiguous dataset layout (default)")
+    p.add_argument("--benchmark-chunked", dest="contiguous", action="store_false",
+                   help="Create resizable chunked datasets instead of contiguous ones")
+    p.add_argument("--write-budget-mb", type=int, default=256, help="Datasets up to this size are generated and written in one call")
     p.add_argument("--overwrite", action="store_true", help="Overwrite output file")
     return p.parse_args()
 
 def main():
     args = parse_args()
-    np.random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
     out = args.out
 
     if os.path.exists(out):
@@ -56,6 +76,8 @@ def main():
             print(f"Error: {out} exists. Use --overwrite to replace.", file=sys.stderr)
             sys.exit(1)
 
+    budget = args.write_budget_mb * 1024 * 1024
+
     total_bytes_target = int(args.size_gb * 1024**3)
     print(f"Generating HDF5 file '{out}' target≈{args.size_gb} GB ({human(total_bytes_target)})")
     # compute number of datasets
@@ -65,7 +87,7 @@ def main():
     # allocate sizes per dataset (in bytes) by sampling log-uniform between min and max
     min_b = args.min_ds_kb * 1024
     max_b = args.max_ds_mb * 1024 * 1024
-    sizes = np.exp(np.random.uniform(np.log(min_b), np.log(max_b), size=total_ds)).astype(int)
+    sizes = np.exp(rng.uniform(np.log(min_b), np.log(max_b), size=total_ds)).astype(int)
 
     # scale sizes to reach target total
     cur_total = sizes.sum()
@@ -77,15 +99,24 @@ def main():
     # recalc
     cur_total = sizes.sum()
     print(f"Total dataset bytes to create: {human(cur_total)}")
+    # one byte buffer reused by every write: a whole dataset up to the budget, or one block
+    scratch = np.empty(min(int(sizes.max(initial=0)), max(budget, 16 << 20)), dtype=np.uint8)
 
     # Create file and hierarchical structure
     libver = "latest"
-    with h5py.File(out, "w", libver=libver) as f:
+    # the chunk-cache slot table is allocated per opened chunked dataset, so nslots stays a modest prime
+    with h5py.File(out, "w", libver=libver, rdcc_nbytes=512 * 1024 * 1024,
+                   rdcc_nslots=10007, rdcc_w0=0.75, track_order=True,
+                   fs_strategy="page") as f:
         # top-level attributes to simulate metadata dicts
         f.attrs['creator'] = "gen_h5_str.py"
         f.attrs['target_bytes'] = total_bytes_target
+        # pass 1: create the whole group/dataset skeleton with attributes, no raw data yet,
+        # so the library can lay the metadata out in contiguous pages (default 4 KiB,
+        # small enough that page-aligned raw data allocations barely grow the file)
+        meta_dt = np.dtype([('created_by', 'S16'), ('sim_year', '<u2'), ('has_vocal', '?')])
         idx = 0
-        pbar = tqdm(total=total_ds, desc="Creating datasets")
+        pending = []
         for b in range(args.branches):
             br_name = f"branch_{b}"
             grp_b = f.create_group(br_name)
@@ -112,44 +143,53 @@ def main():
                     chunk_elems = max(1, target_chunk_bytes // elem_size)
                     chunk_rows = max(1, min(rows, int(math.sqrt(chunk_elems))))
                     chunk_cols = max(1, int(chunk_elems // chunk_rows))
+                    # keep cols a whole number of chunk columns so row-stripes never split a chunk
+                    chunk_cols = min(chunk_cols, cols)
+                    cols = cols // chunk_cols * chunk_cols
+                    shape = (rows, cols)
                     chunk_shape = (chunk_rows, chunk_cols)
-                    # create dataset
-                    dset = grp_s.create_dataset(ds_name, shape=shape, maxshape=(None, None),
-                                                dtype=dtype, chunks=chunk_shape)
-                    # add attributes to simulate dict metadata
-                    dset.attrs['created_by'] = 'gen_h5_str.py'
-                    dset.attrs['sim_year'] = 1900 + (idx % 120)
-                    dset.attrs['has_vocal'] = bool(idx % 2)
-                    # write random data in small blocks to avoid high memory
-                    # write row-by-row or in blocks of 1024 rows
-                    block_rows = 256
-                    written = 0
-                    total_rows = shape[0]
-                    for start in range(0, total_rows, block_rows):
-                        end = min(total_rows, start + block_rows)
-                        block_shape = (end - start, shape[1])
-                        arr = np.random.rand(*block_shape).astype(dtype)
-                        dset[start:end, :] = arr
-                        written += arr.nbytes
+                    # create dataset: contiguous unless chunked layout is benchmarked
+                    if args.contiguous:
+                        dset = grp_s.create_dataset(ds_name, shape=shape, dtype=dtype)
+                    else:
+                        dset = grp_s.create_dataset(ds_name, shape=shape, maxshape=(None, None),
+                                                    dtype=dtype, chunks=chunk_shape)
+                    # add a compound attribute to simulate dict metadata: dset.attrs['meta']['sim_year']
+                    dset.attrs.create('meta', np.array((b'gen_h5_str.py', 1900 + (idx % 120), bool(idx % 2)), dtype=meta_dt))
+                    # keep only the path: an open handle would pin its chunk cache until pass 2
+                    pending.append((dset.name, chunk_rows))
                     idx += 1
-                    pbar.update(1)
-        pbar.close()
-        # add a group that simulates lists and dicts as nested keys + variable-length strings
+        # add a group that simulates lists and dicts with variable-length strings
         meta_grp = f.create_group("metadata_collections")
-        meta_grp.attrs['note'] = "Collections: lists and dict-like structures using groups and datasets."
-        # create several "list" groups containing variable-length strings
+        meta_grp.attrs['note'] = "Collections: lists and dict-like structures stored as stacked datasets."
+        # store the "lists" as one dataset of variable-length strings, one row per list
         vlen_dt = h5py.string_dtype(encoding='utf-8')
-        for i in range(10):
-            lg = meta_grp.create_group(f"list_{i}")
-            # create a dataset of strings
-            entries = [f"item_{i}_{j}" for j in range(1000)]
-            lg.create_dataset("items", data=np.array(entries, dtype=object), dtype=vlen_dt)
-        # create a nested dict-like group
+        entries = [[f"item_{i}_{j}" for j in range(1000)] for i in range(10)]
+        meta_grp.create_dataset("lists", data=np.array(entries, dtype=object), dtype=vlen_dt)
+        # create a dict-like group: one (keys, 128) dataset indexed by key
         dict_grp = meta_grp.create_group("big_dict")
-        for k in range(500):
-            sub = dict_grp.create_group(f"key_{k}")
-            sub.attrs['type'] = "dict_entry"
-            sub.create_dataset("value", data=np.random.randint(0, 1<<30, size=(128,)), dtype=np.int64)
+        dict_grp.create_dataset("values", data=rng.integers(0, 1 << 30, size=(500, 128), dtype=np.int64))
+        dict_grp.attrs['type'] = np.array(["dict_entry"] * 500, dtype=h5py.string_dtype())
+
+        # pass 2: bulk-write the raw data of every dataset
+        for path, chunk_rows in tqdm(pending, desc="Writing datasets"):
+            # reopened per dataset and released when the next one is bound
+            dset = f[path]
+            shape = dset.shape
+            rows, cols = shape
+            dtype = dset.dtype
+            elem_size = dtype.itemsize
+            # write random data in one call when it fits the memory budget,
+            # otherwise fall back to blocks of whole chunk row-stripes
+            if rows * cols * elem_size <= budget:
+                dset[...] = random_block(rng, shape, dtype, scratch)
+            else:
+                block_rows = max(chunk_rows, ((16 << 20) // (cols * elem_size)) // chunk_rows * chunk_rows)
+                total_rows = shape[0]
+                for start in range(0, total_rows, block_rows):
+                    end = min(total_rows, start + block_rows)
+                    dset[start:end, :] = random_block(rng, (end - start, shape[1]), dtype, scratch)
+
     print("Done. File written:", out)
     print("Actual file size:", human(os.path.getsize(out)))
 
@@ -8,10 +8,13 @@ Usage:
 """
 
 import argparse
+import itertools
 import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import h5py
 import zarr
+import numcodecs
 from tqdm import tqdm
 
 def parse_size(size_str):
@@ -61,20 +64,26 @@ def create_zarr_file(filename, size_bytes):
     store = zarr.DirectoryStore(filename)
     root = zarr.group(store=store)
     rng = np.random.default_rng(42)
-    total_written = 0
+    ngroups, narrays, dshape = 10, 5, (256, 256)
+    # generate all arrays with a single RNG call
+    data = rng.random((ngroups, narrays) + dshape, dtype=np.float32)
+    # keep writing arrays until the requested size is exceeded
+    count = min(ngroups * narrays, size_bytes // data[0, 0].nbytes + 1)
+    keys = list(itertools.product(range(ngroups), range(narrays)))[:count]
+    # each group is created once, however many of its arrays are written
+    groups = {i: root.create_group(f"group_{i}") for i in sorted({i for i, _ in keys})}
+    compressor = numcodecs.Blosc(cname="lz4", clevel=3, shuffle=numcodecs.Blosc.SHUFFLE)
 
-    for i in tqdm(range(10), desc="Creating Zarr groups"):
-        g = root.create_group(f"group_{i}")
-        for j in range(5):
-            dshape = (256, 256)
-            arr = g.create_dataset(
-                f"data_{j}", shape=dshape, dtype="float32", compressor=zarr.get_codec({"id": "zlib", "level": 5})
-            )
-            data = rng.random(dshape, dtype=np.float32)
-            arr[:] = data
-            total_written += data.nbytes
-            if total_written > size_bytes:
-                break
+    def write(key):
+        i, j = key
+        arr = groups[i].create_dataset(f"data_{j}", shape=dshape, dtype="float32", compressor=compressor)
+        arr[:] = data[i, j]
+        return data[i, j].nbytes
+
+    # every array lives in its own chunk files and Blosc releases the GIL,
+    # so independent arrays are compressed and written concurrently
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        total_written = sum(tqdm(ex.map(write, keys), total=len(keys), desc="Creating Zarr arrays"))
 
     print(f"✅ Zarr dataset '{filename}' created ({total_written/1e6:.2f} MB).")
 
@@ -2,7 +2,9 @@
 """
 h5_parallel_bench.py
 
-MPI-parallel benchmark: each rank reads a subset of datasets from the given HDF5 file using the MPI driver.
+MPI-parallel benchmark: all ranks read the datasets of the given HDF5 file using the MPI driver,
+either collectively (each rank a block of rows of every dataset, the default) or independently
+(--independent: each rank whole datasets, assigned round-robin), followed by random partial reads.
 Collects per-rank CPU/RAM/IO samples (via psutil) and reduces summaries to rank 0.
 
 Usage:
@@ -21,6 +23,29 @@ import psutil
 from mpi4py import MPI
 import h5py
 import threading
+from collections import defaultdict
+
+# H5Sselect_hyperslab cost grows with the number of OR-ed slabs, so cap each batch
+MAX_SLABS_PER_READ = 64
+
+# cpu_percent(interval=None) needs a gap between calls to be meaningful;
+# the sampler never takes fresh readings closer together than this
+MIN_POLL_INTERVAL = 0.1
+
+# one StatsSampler tick: time, cpu%, rss, proc read/write bytes, system read/write bytes
+SAMPLE_DTYPE = np.dtype([('t', 'f8'), ('cpu', 'f4'), ('rss', 'i8'), ('prb', 'i8'), ('pwb', 'i8'),
+                         ('srb', 'i8'), ('swb', 'i8')])
+
+# per-rank records gathered to rank 0; field names are the keys written to the JSON output
+# n_full_ds/read_full_*: what this rank actually read in the full phase (with collective
+# reads: its row block of every dataset); n_assigned/assigned_bytes_estimate: its
+# round-robin share, read whole by independent full reads and used by the random reads
+SUMMARY_DTYPE = np.dtype([('rank', 'i4'), ('n_full_ds', 'i4'),
+                          ('n_assigned', 'i4'), ('assigned_bytes_estimate', 'i8'),
+                          ('read_full_bytes', 'i8'), ('read_full_time', 'f8'),
+                          ('read_rand_bytes', 'i8'), ('read_rand_time', 'f8')])
+STATS_DTYPE = np.dtype([('proc_read_delta', 'i8'), ('sys_read_delta', 'i8'), ('duration', 'f8'),
+                        ('cpu_mean', 'f8'), ('cpu_max', 'f8'), ('mem_max', 'i8')])
 
 def parse_args():
     import sys
@@ -29,75 +54,338 @@ def parse_args():
     p.add_argument("--out", default="parallel_results.json", help="Output JSON file (rank0 will write)")
     p.add_argument("--poll-interval", type=float, default=0.2, help="Sampling interval (s)")
     p.add_argument("--sample-reads", type=int, default=50, help="Random reads per rank")
+    p.add_argument("--rng-seed", type=int, default=0, help="Base seed for random reads (each rank uses seed + rank)")
     p.add_argument("--method", default="mpar", help="Method for h4py to use mpar or swmr")
+    p.add_argument("--rdcc-mb", type=int, default=512, help="Raw data chunk cache size per rank (MB)")
+    p.add_argument("--independent", action="store_true",
+                   help="Read whole datasets with independent I/O (default: collective when using the MPI driver)")
+    p.add_argument("--device", choices=["cpu", "cuda"], default="cpu",
+                   help="Where to reduce full reads; cuda uses CuPy and implies --independent")
+    p.add_argument("--cuda-min-mb", type=float, default=8, help="Smallest float32 dataset reduced on the GPU (MB)")
+    p.add_argument("--coll-metadata", action="store_true", help="Enable HDF5 collective metadata I/O (mpar method only)")
     return p.parse_args()
 
 class StatsSampler(threading.Thread):
-    def __init__(self, pid, interval=0.2):
+    def __init__(self, pid, interval=0.2, capacity=4096, sys_io_every=5):
         super().__init__()
         self.proc = psutil.Process(pid)
         self.interval = interval
-        self.samples = []
+        # system-wide disk counters are refreshed only every sys_io_every ticks
+        self.sys_io_every = max(1, sys_io_every)
+        # raw samples go to a record buffer that doubles when full (never wraps, so
+        # first/last deltas always cover the whole run); summaries are computed at the end
+        self.buf = np.empty(capacity, dtype=SAMPLE_DTYPE)
+        self.n = 0
+        # counters at priming time (cpu 0.0), the reference for deltas and duration
+        self.baseline = None
         self.stop_event = threading.Event()
+    def _append(self, row):
+        if self.n == len(self.buf):
+            grown = np.empty(2 * len(self.buf), dtype=SAMPLE_DTYPE)
+            grown[:self.n] = self.buf
+            self.buf = grown
+        self.buf[self.n] = row
+        self.n += 1
+    def _reading(self, t, sys_io, cpu=None):
+        """One sample row; cpu_percent is only queried when cpu is not given."""
+        # one pass over /proc/<pid> for all per-process counters
+        with self.proc.oneshot():
+            if cpu is None:
+                cpu = self.proc.cpu_percent(interval=None)
+            mem = self.proc.memory_info().rss
+            io = self.proc.io_counters()
+        return (t, cpu, mem, io.read_bytes, io.write_bytes,
+                sys_io.read_bytes, sys_io.write_bytes)
     def run(self):
+        # the first cpu_percent(interval=None) call only sets the baseline and returns 0.0:
+        # prime it, then let a full interval pass so the first reading covers a real window.
+        # This sampler is the only caller of cpu_percent on the process: any other call
+        # would reset the baseline under it.
+        self.proc.cpu_percent(interval=None)
+        try:
+            # counters at start: deltas and duration are measured from here, so the
+            # I/O of the first interval (file open, dataset walk) is included
+            self.baseline = np.array(self._reading(time.time(), psutil.disk_io_counters(), cpu=0.0),
+                                     dtype=SAMPLE_DTYPE)
+        except Exception:
+            pass
+        last_sampled = time.perf_counter_ns()
+        self.stop_event.wait(self.interval)
+        tick = 0
+        sys_io = None
         while not self.stop_event.is_set():
+            # wall-clock stamp for the record, monotonic clock for the rate limit
             t = time.time()
+            now = time.perf_counter_ns()
+            if self.n and now - last_sampled < MIN_POLL_INTERVAL * 1e9:
+                # polled faster than the floor: repeat the cached reading
+                row = self.buf[self.n - 1].copy()
+                row['t'] = t
+                self._append(row)
+                self.stop_event.wait(self.interval)
+                continue
             try:
-                cpu = self.proc.cpu_percent(interval=None)
-                mem = self.proc.memory_info().rss
-                io = self.proc.io_counters()
-                sys_io = psutil.disk_io_counters()
-                self.samples.append({
-                    "time": t,
-                    "cpu_percent": cpu,
-                    "mem_rss": mem,
-                    "proc_read_bytes": io.read_bytes,
-                    "proc_write_bytes": io.write_bytes,
-                    "sys_read_bytes": sys_io.read_bytes,
-                    "sys_write_bytes": sys_io.write_bytes,
-                })
-            except Exception as e:
-                self.samples.append({"time": t, "error": str(e)})
-            time.sleep(self.interval)
+                if sys_io is None or tick % self.sys_io_every == 0:
+                    sys_io = psutil.disk_io_counters()
+                tick += 1
+                self._append(self._reading(t, sys_io))
+                last_sampled = now
+            except Exception:
+                # process might disappear; skip this tick
+                pass
+            # wakes up immediately on stop()
+            self.stop_event.wait(self.interval)
+        # final reading after stop(), so the deltas reach the end of the run;
+        # CPU% is only measured again if the window since the last reading is wide enough
+        try:
+            cpu = None
+            if self.n and time.perf_counter_ns() - last_sampled < MIN_POLL_INTERVAL * 1e9:
+                cpu = self.buf['cpu'][self.n - 1]
+            self._append(self._reading(time.time(), psutil.disk_io_counters(), cpu))
+        except Exception:
+            pass
     def stop(self):
         self.stop_event.set()
+    def samples(self):
+        """All recorded samples in time order."""
+        return self.buf[:self.n]
 
 def list_datasets(h5f):
+    # low-level H5Ovisit: no Python Dataset/Group wrapper is built per object;
+    # dataset byte sizes are recorded on the way so nobody has to reopen them later
     ds_paths = []
-    def visitor(name, obj):
-        if isinstance(obj, h5py.Dataset):
-            ds_paths.append(name)
-    h5f.visititems(visitor)
-    return ds_paths
+    ds_nbytes = []
+    def visitor(name, info):
+        if info.type == h5py.h5o.TYPE_DATASET:
+            dsid = h5py.h5d.open(h5f.id, name)
+            ds_paths.append(name.decode())
+            ds_nbytes.append(dsid.get_space().get_simple_extent_npoints() * dsid.get_type().get_size())
+    h5py.h5o.visit(h5f.id, visitor, info=True)
+    return ds_paths, np.array(ds_nbytes, dtype=np.int64)
+
+def open_coll_metadata(path, comm, rdcc_nbytes, rdcc_nslots, rdcc_w0):
+    """
+    Open path read-only with the MPI-IO driver and collective metadata I/O enabled:
+    one rank reads each metadata block and broadcasts it to the others.
+    Every metadata read then has to be issued by all ranks together, so this handle
+    is only used for rank-uniform phases (the dataset walk and read_collective).
+    """
+    fapl = h5py.h5p.create(h5py.h5p.FILE_ACCESS)
+    fapl.set_fapl_mpio(comm, MPI.INFO_NULL)
+    fapl.set_all_coll_metadata_ops(True)
+    fapl.set_coll_metadata_write(True)
+    fapl.set_cache(0, rdcc_nslots, rdcc_nbytes, rdcc_w0)
+    fid = h5py.h5f.open(os.fsencode(path), h5py.h5f.ACC_RDONLY, fapl=fapl)
+    return h5py.File(fid)
+
+def bcast_datasets(comm, ds_paths, ds_nbytes):
+    """
+    Broadcast rank 0's dataset paths and byte sizes: the paths as one NUL-separated
+    byte buffer and the sizes as an int64 array, both without pickling.
+    """
+    if comm.rank == 0:
+        blob = np.frombuffer(bytearray(b"\x00".join(p.encode() for p in ds_paths)), dtype=np.uint8)
+        counts = np.array([blob.size, ds_nbytes.size], dtype=np.int64)
+    else:
+        counts = np.empty(2, dtype=np.int64)
+    comm.Bcast(counts, root=0)
+    if comm.rank != 0:
+        blob = np.empty(int(counts[0]), dtype=np.uint8)
+        ds_nbytes = np.empty(int(counts[1]), dtype=np.int64)
+    comm.Bcast(blob, root=0)
+    comm.Bcast(ds_nbytes, root=0)
+    if not blob.size:
+        return [], ds_nbytes
+    return [p.decode() for p in blob.tobytes().split(b"\x00")], ds_nbytes
+
+def alloc_scratch(h5f, assigned_ds):
+    """Allocate one flat read buffer per numeric dtype, sized to the largest assigned dataset."""
+    maxn = {}
+    for name in assigned_ds:
+        d = h5f[name]
+        if np.issubdtype(d.dtype, np.number):
+            maxn[d.dtype] = max(maxn.get(d.dtype, 0), d.size)
+    return {dt: np.empty(n, dtype=dt) for dt, n in maxn.items()}
+
+def slab_count(shape):
+    """Extent of the small slab read by one random partial read."""
+    if len(shape) == 1:
+        return (min(1024, shape[0]),)
+    return (min(4, shape[0]), min(1024, shape[1])) + tuple(shape[2:])
+
+def read_slabs(d, starts, count, scratch):
+    """Read the union of equally sized hyperslabs of d with a single H5Dread."""
+    fspace = d.id.get_space()
+    fspace.select_hyperslab(starts[0], count)
+    for start in starts[1:]:
+        fspace.select_hyperslab(start, count, op=h5py.h5s.SELECT_OR)
+    npoints = fspace.get_select_npoints()
+    buf = scratch.get(d.dtype)
+    if buf is None or buf.size < npoints:
+        # H5Dread does not check the buffer size: never hand it a short slice
+        buf = scratch[d.dtype] = np.empty(npoints, dtype=d.dtype)
+    arr = buf[:npoints]
+    d.id.read(h5py.h5s.create_simple((npoints,)), fspace, arr)
+    return arr
 
-def read_assigned(h5f, assigned_ds, sample_reads):
+def read_collective(h5f, ds_paths, comm, scratch):
+    """
+    Full read in which all ranks take part in every dataset's H5Dread using
+    H5FD_MPIO_COLLECTIVE transfer, each rank reading its own block of leading-axis
+    rows, so MPI-IO aggregators can merge neighbouring requests into large reads.
+    Non-numeric datasets cannot be transferred collectively; every rank reads them
+    independently (keeping metadata access rank-uniform) and their round-robin owner
+    accounts for the bytes. Returns (bytes read, datasets read from) for this rank.
+    """
+    rank, size = comm.rank, comm.size
+    dxpl = h5py.h5p.create(h5py.h5p.DATASET_XFER)
+    dxpl.set_dxpl_mpio(h5py.h5fd.MPIO_COLLECTIVE)
+    total_read = 0
+    n_ds = 0
+    for i, name in enumerate(ds_paths):
+        dsid = h5py.h5d.open(h5f.id, name.encode())
+        dtype = dsid.dtype
+        if not np.issubdtype(dtype, np.number):
+            # vlen reads go through the global heap (metadata), so every rank reads the
+            # dataset through the handle it already has; only the owner counts the bytes
+            arr = h5py.Dataset(dsid)[...]
+            if i % size == rank:
+                total_read += arr.nbytes
+                n_ds += 1
+            continue
+        fspace = dsid.get_space()
+        shape = fspace.shape
+        if shape:
+            r0, r1 = shape[0] * rank // size, shape[0] * (rank + 1) // size
+            n = (r1 - r0) * int(np.prod(shape[1:]))
+            if n:
+                fspace.select_hyperslab((r0,) + (0,) * (len(shape) - 1), (r1 - r0,) + shape[1:])
+        else:
+            n = 1 if rank == 0 else 0
+        mspace = h5py.h5s.create_simple((max(n, 1),))
+        if not n:
+            # ranks without rows still have to join the collective call
+            fspace.select_none()
+            mspace.select_none()
+        buf = scratch.get(dtype)
+        if buf is None or buf.size < max(n, 1):
+            buf = scratch[dtype] = np.empty(max(n, 1), dtype=dtype)
+        arr = buf[:max(n, 1)]
+        dsid.read(mspace, fspace, arr, dxpl=dxpl)
+        if n:
+            total_read += arr.nbytes
+            n_ds += 1
+            _ = arr.sum(dtype=arr.dtype.newbyteorder("="))
+    return total_read, n_ds
+
+def read_full_cuda(h5f, names):
+    """
+    Read float32 datasets into pinned host memory and reduce them on the GPU with CuPy.
+    Two pinned/device buffer pairs alternate, so the H5Dread of dataset k+1 overlaps
+    the asynchronous copy and reduction of dataset k on a non-blocking stream.
+    Returns the bytes read.
+    """
+    import cupy as cp
+    maxn = max(h5f[name].size for name in names)
+    stream = cp.cuda.Stream(non_blocking=True)
+    host, dev, done = [], [], [None, None]
+    for _ in range(2):
+        pinned = cp.cuda.alloc_pinned_memory(maxn * 4)
+        host.append(np.frombuffer(pinned, np.float32, maxn))
+        dev.append(cp.empty(maxn, dtype=cp.float32))
+    total = cp.zeros((), dtype=cp.float64)
+    total_read = 0
+    for k, name in enumerate(names):
+        d = h5f[name]
+        slot = k % 2
+        if done[slot] is not None:
+            # wait until the copy out of this slot (dataset k-2) has finished
+            done[slot].synchronize()
+        view = host[slot][:d.size]
+        d.read_direct(view.reshape(d.shape))
+        with stream:
+            dev[slot][:d.size].set(view, stream=stream)
+            total += dev[slot][:d.size].sum(dtype=cp.float64)
+        done[slot] = stream.record()
+        total_read += view.nbytes
+    stream.synchronize()
+    _ = float(total)
+    return total_read
+
+def read_full(h5f, assigned_ds, comm=None, all_ds=None, cuda_min_bytes=None):
     # assigned_ds: list of dataset paths this rank should read
+    # if comm is given, the full read is done collectively over all_ds (see read_collective);
+    # that path opens only datasets every rank opens, so it is safe under collective metadata I/O
+    # if cuda_min_bytes is given, float32 datasets at least that large are reduced on the GPU
+    # numeric datasets are read into views of a reused per-dtype scratch buffer,
+    # returned for the random reads; read_collective grows it on demand
+    scratch = alloc_scratch(h5f, assigned_ds) if comm is None else {}
+    gpu_ds = []
+    cpu_ds = assigned_ds
+    if cuda_min_bytes is not None:
+        gpu_ds = [p for p in assigned_ds
+                  if h5f[p].dtype == np.float32 and h5f[p].size * 4 >= cuda_min_bytes]
+        on_gpu = set(gpu_ds)
+        cpu_ds = [p for p in assigned_ds if p not in on_gpu]
     # Read entire assigned datasets sequentially
     total_read = 0
-    t0 = time.time()
-    for name in assigned_ds:
-        d = h5f[name]
-        arr = d[...]
-        total_read += arr.nbytes
-        _ = arr.sum(dtype=np.float64)
-    t_full = time.time() - t0
-    # random partial reads (sample_reads)
+    n_ds = len(assigned_ds)
+    t0 = time.perf_counter_ns()
+    if comm is not None:
+        total_read, n_ds = read_collective(h5f, all_ds, comm, scratch)
+    else:
+        if gpu_ds:
+            total_read += read_full_cuda(h5f, gpu_ds)
+        for name in cpu_ds:
+            d = h5f[name]
+            buf = scratch.get(d.dtype)
+            if buf is None or d.size == 0:
+                arr = d[...]
+            else:
+                arr = buf[:d.size].reshape(d.shape)
+                d.read_direct(arr)
+            total_read += arr.nbytes
+            # touch the data with a reduction in its own width (no float64 up-cast pass);
+            # the accumulator is native-endian since ufuncs reject big-endian dtype= arguments
+            if np.issubdtype(arr.dtype, np.number):
+                _ = arr.sum(dtype=arr.dtype.newbyteorder("="))
+    t_full = (time.perf_counter_ns() - t0) / 1e9
+    return {"full_bytes": int(total_read), "full_time": t_full, "full_ds": n_ds}, scratch
+
+def read_random(h5f, assigned_ds, sample_reads, rng, scratch):
+    # random partial reads (sample_reads): draw all picks and slab offsets up front
+    # (outside the timed loop) and group them per dataset, so that every dataset is
+    # opened once and its slabs are fetched as one hyperslab union per H5Dread
     total_rand = 0
-    t0 = time.time()
-    for _ in range(sample_reads):
-        if not assigned_ds:
-            break
-        p = np.random.choice(assigned_ds)
+    idxs = rng.integers(0, len(assigned_ds), size=sample_reads) if assigned_ds else []
+    offsets = rng.random(len(idxs))
+    groups = defaultdict(list)
+    for i, u in zip(idxs, offsets):
+        groups[assigned_ds[i]].append(u)
+    t0 = time.perf_counter_ns()
+    for p, us in groups.items():
         d = h5f[p]
-        shape = d.shape
-        if len(shape) == 1:
-            arr = d[:min(1024, shape[0])]
-        else:
-            arr = d[:min(4, shape[0]), :min(1024, shape[1])]
-        total_rand += arr.nbytes
-        _ = arr.mean()
-    t_rand = time.time() - t0
-    return {"full_bytes": int(total_read), "full_time": t_full, "rand_bytes": int(total_rand), "rand_time": t_rand}
+        if d.size == 0:
+            continue
+        count = slab_count(d.shape)
+        tail = (0,) * (d.ndim - 1)
+        starts = [(int(u * (d.shape[0] - count[0] + 1)),) + tail for u in us]
+        for k in range(0, len(starts), MAX_SLABS_PER_READ):
+            batch = starts[k:k + MAX_SLABS_PER_READ]
+            if np.issubdtype(d.dtype, np.number):
+                arr = read_slabs(d, batch, count, scratch)
+                total_rand += arr.nbytes
+                _ = arr.sum(dtype=arr.dtype.newbyteorder("="))
+            else:
+                for start in batch:
+                    arr = d[tuple(slice(s, s + c) for s, c in zip(start, count))]
+                    total_rand += arr.nbytes
+    t_rand = (time.perf_counter_ns() - t0) / 1e9
+    return {"rand_bytes": int(total_rand), "rand_time": t_rand}
+
+def records(arr):
+    """Convert a record array into a list of JSON-serializable dicts."""
+    return [{k: r[k].item() for k in arr.dtype.names} for r in arr]
 
 def main():
     args = parse_args()
@@ -110,67 +398,101 @@ def main():
     sampler = StatsSampler(pid=os.getpid(), interval=args.poll_interval)
     sampler.start()
 
+    # the chunk cache must hold at least one full chunk per active dataset;
+    # read_full reads whole datasets one at a time, so per rank that is a single chunk;
+    # the slot table is allocated (and zeroed) on every chunked dataset open, so nslots stays a modest prime
+    cache = dict(rdcc_nbytes=args.rdcc_mb * 1024 * 1024, rdcc_nslots=10007, rdcc_w0=0.75)
+    coll_metadata = False
     if args.method == "mpar":
         # open file collectively
         try:
-            h5f = h5py.File(args.file, "r", driver="mpio", comm=comm)
+            if args.coll_metadata:
+                h5f = open_coll_metadata(args.file, comm, **cache)
+                coll_metadata = True
+            else:
+                h5f = h5py.File(args.file, "r", driver="mpio", comm=comm, **cache)
         except Exception as e:
             if rank == 0:
                 print("ERROR opening HDF5 with MPI driver:", e)
                 print("Ensure h5py was built with MPI support. Falling back to serial open (may not be parallel).")
             # fallback to serial file open
-            h5f = h5py.File(args.file, "r")
+            h5f = h5py.File(args.file, "r", **cache)
     else:
-        h5f = h5py.File(args.file, "r", swmr=True)
+        h5f = h5py.File(args.file, "r", swmr=True, **cache)
 
-    # get list of datasets (let rank 0 gather and scatter)
-    if rank == 0:
-        ds_paths = list_datasets(h5f)
+    # get list of datasets (let rank 0 gather and scatter); with collective
+    # metadata I/O every rank must take part in the walk instead
+    if coll_metadata:
+        ds_paths, ds_nbytes = list_datasets(h5f)
     else:
-        ds_paths = None
-    ds_paths = comm.bcast(ds_paths, root=0)
+        ds_paths, ds_nbytes = list_datasets(h5f) if rank == 0 else (None, None)
+        ds_paths, ds_nbytes = bcast_datasets(comm, ds_paths, ds_nbytes)
 
     # distribute dataset paths round-robin
-    assigned = [p for i,p in enumerate(ds_paths) if (i % size) == rank]
+    assigned_idx = np.arange(rank, len(ds_paths), size)
+    assigned = [ds_paths[i] for i in assigned_idx]
     # perform read workload
-    result = read_assigned(h5f, assigned, args.sample_reads)
+    # rank-local PCG64 generator, no shared legacy np.random state
+    rng = np.random.default_rng(args.rng_seed + rank)
+    collective = h5f.driver == "mpio" and not args.independent and args.device == "cpu"
+    # collective metadata I/O is only used while every rank issues the same metadata reads:
+    # the walk above and read_collective. Per-rank dataset opens and chunk-index lookups
+    # (independent full reads, random reads) would hang it, so those phases continue on a
+    # handle opened without it.
+    if coll_metadata and not collective:
+        h5f.close()
+        h5f = h5py.File(args.file, "r", driver="mpio", comm=comm, **cache)
+        coll_metadata = False
+    if collective:
+        result, scratch = read_full(h5f, assigned, comm=comm, all_ds=ds_paths)
+    elif args.device == "cuda":
+        result, scratch = read_full(h5f, assigned, cuda_min_bytes=int(args.cuda_min_mb * 1024 * 1024))
+    else:
+        result, scratch = read_full(h5f, assigned)
+    if coll_metadata:
+        h5f.close()
+        h5f = h5py.File(args.file, "r", driver="mpio", comm=comm, **cache)
+    result.update(read_random(h5f, assigned, args.sample_reads, rng, scratch))
 
     # stop sampler and collect samples
     sampler.stop()
     sampler.join()
     # reduce summaries to root
-    local_summary = {
-        "rank": rank,
-        "n_assigned": len(assigned),
-        "assigned_bytes_estimate": sum(h5f[p].size * h5f[p].dtype.itemsize for p in assigned),
-        "read_full_bytes": result["full_bytes"],
-        "read_full_time": result["full_time"],
-        "read_rand_bytes": result["rand_bytes"],
-        "read_rand_time": result["rand_time"],
-    }
-    # send local samples length and data to root (potentially large)
-    # we'll compress samples into a small summary object per rank to avoid very large MPI messages
-    if sampler.samples:
-        first = sampler.samples[0]
-        last = sampler.samples[-1]
-        proc_read_delta = last.get('proc_read_bytes', 0) - first.get('proc_read_bytes', 0)
-        sys_read_delta = last.get('sys_read_bytes', 0) - first.get('sys_read_bytes', 0)
+    local_summary = np.array([(
+        rank,
+        result["full_ds"],
+        len(assigned),
+        ds_nbytes[assigned_idx].sum(),
+        result["full_bytes"],
+        result["full_time"],
+        result["rand_bytes"],
+        result["rand_time"],
+    )], dtype=SUMMARY_DTYPE)
+    # compress samples into a small fixed-size record per rank to avoid very large MPI messages
+    samples = sampler.samples()
+    if len(samples):
+        # deltas from the counters taken when the sampler started, or the first sample
+        first = sampler.baseline if sampler.baseline is not None else samples[0]
+        local_stats = np.array([(
+            samples['prb'][-1] - first['prb'],
+            samples['srb'][-1] - first['srb'],
+            samples['t'][-1] - first['t'],
+            samples['cpu'].mean(),
+            samples['cpu'].max(),
+            samples['rss'].max(),
+        )], dtype=STATS_DTYPE)
     else:
-        proc_read_delta = 0
-        sys_read_delta = 0
-    local_stats = {
-        "proc_read_delta": int(proc_read_delta),
-        "sys_read_delta": int(sys_read_delta),
-        "duration": sampler.samples[-1]['time'] - sampler.samples[0]['time'] if sampler.samples else 0,
-        "cpu_samples": [s["cpu_percent"] for s in sampler.samples] if sampler.samples else [],
-        "mem_max": max((s.get("mem_rss",0) for s in sampler.samples), default=0),
-    }
-
-    all_summaries = comm.gather(local_summary, root=0)
-    all_stats = comm.gather(local_stats, root=0)
+        local_stats = np.zeros(1, dtype=STATS_DTYPE)
+
+    # typed buffers go through MPI_Gather directly, without pickling
+    all_summaries = np.empty(size, dtype=SUMMARY_DTYPE)
+    all_stats = np.empty(size, dtype=STATS_DTYPE)
+    comm.Gather([local_summary, MPI.BYTE], [all_summaries, MPI.BYTE] if rank == 0 else None, root=0)
+    comm.Gather([local_stats, MPI.BYTE], [all_stats, MPI.BYTE] if rank == 0 else None, root=0)
 
     if rank == 0:
-        out = {"file": args.file, "ranks": size, "summaries": all_summaries, "stats": all_stats}
+        out = {"file": args.file, "ranks": size, "collective": collective,
+               "summaries": records(all_summaries), "stats": records(all_stats)}
         with open(args.out, "w") as fo:
             json.dump(out, fo, indent=2)
         print(f"{args.method} benchmark results written to {args.out}")
@@ -7,6 +7,15 @@ import os
 
 FILE_NAME = "swmr_demo.h5"
 DATASET_NAME = "values"
+COUNT_NAME = "count"
+# chunk size: chunk_elems = chunk_bytes / itemsize. Chunks must fit the reader's chunk cache
+# (1MB by default, 4MB as opened below) and be large enough to keep the chunk index small;
+# 256 KiB / 4-byte float32 = 65536 elements
+CHUNK = 65536       # elements per chunk, one chunk is appended per block
+PREALLOC = 1_000_000  # initial extent; the dataset is only resized once this is used up
+# reader chunk cache: room for several chunks; nslots a prime well above the cached chunk count
+READER_RDCC_NBYTES = 4 * 1024 * 1024
+READER_RDCC_NSLOTS = 521
 
 
 def writer_process():
@@ -15,28 +24,37 @@ def writer_process():
 
     # Create a new HDF5 file
     with h5py.File(FILE_NAME, "w", libver="latest") as f:
-        # Create resizable (extendable) dataset, chunked as required for SWMR
+        # Preallocated extendable dataset, chunked as required for SWMR
         dset = f.create_dataset(
             DATASET_NAME,
-            shape=(0,),
+            shape=(PREALLOC,),
             maxshape=(None,),
-            dtype="f",
-            chunks=(100,),
+            dtype="f4",
+            chunks=(CHUNK,),
         )
+        # number of valid elements in DATASET_NAME, the extent runs ahead of the data;
+        # chunked, since a SWMR reader cannot open a contiguous dataset with late allocation
+        count = f.create_dataset(COUNT_NAME, shape=(1,), maxshape=(None,), chunks=(1,), dtype="i8")
+        # all objects exist, switch to SWMR so readers can follow the writes
+        f.swmr_mode = True
 
+        cursor = 0
         for i in range(10):
-            # Simulate new data block
-            new_data = np.random.random(100)
-            old_size = dset.shape[0]
-            new_size = old_size + new_data.size
-
-            # Resize and append
-            dset.resize((new_size,))
-            dset[old_size:] = new_data
-
-            # Flush data so SWMR readers can see it
-            f.flush()
-            print(f"[Writer] Wrote block {i+1}, total size={new_size}")
+            # Simulate new data block, exactly one chunk
+            new_data = np.random.random(CHUNK).astype(np.float32)
+            if cursor + CHUNK > dset.shape[0]:
+                # preallocation exhausted, grow by doubling
+                dset.resize((2 * dset.shape[0],))
+
+            # write the whole chunk as-is, bypassing selection and type conversion
+            dset.id.write_direct_chunk((cursor,), new_data.tobytes())
+            cursor += CHUNK
+
+            # flush data before publishing the new count so readers never see unwritten values
+            dset.flush()
+            count[0] = cursor
+            count.flush()
+            print(f"[Writer] Wrote block {i+1}, total size={cursor}")
             time.sleep(1)  # simulate time delay between writes
 
     print("[Writer] Finished writing.")
@@ -49,17 +67,21 @@ def reader_process():
         time.sleep(0.2)
 
     print("[Reader] Opening file in SWMR mode...")
-    with h5py.File(FILE_NAME, "r", swmr=True) as f:
+    with h5py.File(FILE_NAME, "r", swmr=True, rdcc_nbytes=READER_RDCC_NBYTES,
+                   rdcc_nslots=READER_RDCC_NSLOTS) as f:
         dset = f[DATASET_NAME]
+        count = f[COUNT_NAME]
         last_size = 0
 
         for _ in range(15):  # poll multiple times
-            f.refresh()  # refresh view of file for new data
-            new_size = dset.shape[0]
+            # refresh both datasets' view of the file for new data
+            count.refresh()
+            dset.refresh()
+            new_size = int(count[0])
             if new_size > last_size:
                 print(f"[Reader] New data detected! Size={new_size}")
                 # Print last few values to demonstrate live read
-                print(f"[Reader] Last 5 values: {dset[-5:]}")
+                print(f"[Reader] Last 5 values: {dset[new_size-5:new_size]}")
                 last_size = new_size
             time.sleep(0.7)
 
@@ -19,7 +19,8 @@ def human(n):
 def main():
     args = parse_args()
     if os.path.exists(args.swmr):
-        s=json.load(open(args.swmr))
+        with open(args.swmr) as fh:
+            s = json.load(fh)
         print("SWMR summary:")
         print("  file:", s.get('file'))
         rank_summaries = False
@@ -30,12 +31,19 @@ def main():
             print("  samples:", len(s.get('samples',[])))
             print("  summary:", s.get('summary',{}))
     if os.path.exists(args.mpar):
-        p=json.load(open(args.mpar))
+        with open(args.mpar) as fh:
+            p = json.load(fh)
         print("")
         print("Parallel summary:")
         print("  file:", p.get('file'))
+        collective = p.get('collective', False)
+        print("  full read:", "collective (row block of every dataset per rank)" if collective else "independent (round-robin datasets)")
         for r in p.get('summaries',[]):
-            print(f"   rank {r['rank']}: assigned {r['n_assigned']} datasets, read_full_bytes={human(r['read_full_bytes'])}, full_time={r['read_full_time']:.3f}s")
+            if collective:
+                print(f"   rank {r['rank']}: full read from {r['n_full_ds']} datasets, read_full_bytes={human(r['read_full_bytes'])}, full_time={r['read_full_time']:.3f}s; "
+                      f"random reads over {r['n_assigned']} assigned datasets")
+            else:
+                print(f"   rank {r['rank']}: assigned {r['n_assigned']} datasets, read_full_bytes={human(r['read_full_bytes'])}, full_time={r['read_full_time']:.3f}s")
 
 if __name__ == "__main__":
     main()